@@ -0,0 +1,9 @@
+import logging
+
+# Configuration commune du logging, appliquée une seule fois à l'import du premier module.
+# Si l'utilisateur (ou un rechargement Jupyter) a déjà configuré un handler, on n'y touche pas.
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
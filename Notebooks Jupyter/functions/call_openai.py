@@ -1,13 +1,134 @@
 import os
+import re
+import json
+import time
+import asyncio
 import logging
-from typing import Optional
-from openai import AzureOpenAI
+import tempfile
+from typing import Dict, List, Optional, Tuple, Union
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from openai import APIError, AuthenticationError, RateLimitError, APIConnectionError
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from functions import _logging  # noqa: F401  (configuration commune du logging)
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Consigne et format des réponses numérotées pour call_openai_api_chunked
+_CHUNK_INSTRUCTION = (
+    "Réponds à chacune des demandes suivantes. "
+    "Commence chaque réponse par '[i] ', où i est le numéro de la demande :"
+)
+# Une réponse s'étend (éventuellement sur plusieurs lignes) jusqu'au marqueur '[n]' suivant
+_CHUNK_ANSWER_PATTERN = re.compile(r"^\[(\d+)\][ \t]*(.*?)\s*(?=^\[\d+\]|\Z)", re.MULTILINE | re.DOTALL)
+
+# Version d'API minimale prenant en charge l'API Batch d'Azure OpenAI
+BATCH_API_VERSION = "2024-10-21"
+# Statuts finaux d'un traitement batch
+_BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+# Politique de réessai pour les erreurs transitoires (limite de taux, connexion, délai dépassé :
+# APITimeoutError hérite d'APIConnectionError). Les clients sont créés avec max_retries=0
+# pour que cette politique soit la seule couche de réessai.
+_retry_transient = retry(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError)),
+    reraise=True,
+)
+
+# Clients partagés par (version d'API, endpoint), créés au premier appel pour réutiliser
+# le pool de connexions HTTP au lieu de refaire la poignée de main TLS à chaque requête
+_CLIENTS: Dict[Tuple[str, str], AzureOpenAI] = {}
+
+def _get_client(
+    api_version: str,
+    azure_endpoint: Optional[str] = None
+) -> AzureOpenAI:
+    """
+    Retourne le client AzureOpenAI du module pour (api_version, azure_endpoint), en le créant au premier appel.
+
+    La clé est lue dans AZURE_OPENAI_API_KEY à la création du client, et l'endpoint dans
+    AZURE_OPENAI_ENDPOINT s'il n'est pas fourni.
+
+    Raises:
+        KeyError: Si AZURE_OPENAI_API_KEY (ou AZURE_OPENAI_ENDPOINT) n'est pas défini.
+    """
+    azure_endpoint = azure_endpoint or os.environ["AZURE_OPENAI_ENDPOINT"]
+    key = (api_version, azure_endpoint)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = AzureOpenAI(
+            api_key=os.environ["AZURE_OPENAI_API_KEY"],
+            api_version=api_version,
+            azure_endpoint=azure_endpoint,
+            max_retries=0
+        )
+    return _CLIENTS[key]
+
+@_retry_transient
+def _complete(
+    client: AzureOpenAI,
+    prompt: str,
+    max_tokens: int,
+    model: str
+) -> str:
+    """
+    Envoie un prompt à Azure OpenAI (avec réessais) et renvoie le texte de la réponse.
+
+    Raises:
+        APIError: En cas d'échec de l'appel après les réessais éventuels.
+    """
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=0.7
+    )
+    return response.choices[0].message.content
+
+def _prepare_client(api_version: str) -> Tuple[Optional[AzureOpenAI], Optional[str]]:
+    """
+    Valide la configuration Azure OpenAI et retourne le client partagé.
+
+    Returns:
+        Tuple[Optional[AzureOpenAI], Optional[str]]: (client, None) si la configuration est valide,
+        sinon (None, message d'erreur).
+    """
+    # Validation de l'endpoint (variable d'environnement)
+    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "")
+    if not azure_endpoint.startswith("https://"):
+        logger.error("L'endpoint Azure doit commencer par 'https://'.")
+        return None, "Erreur : Endpoint Azure invalide."
+
+    # Récupération du client Azure OpenAI partagé (créé au premier appel)
+    try:
+        return _get_client(api_version, azure_endpoint), None
+    except KeyError:
+        logger.error("Clé API manquante dans les variables d'environnement.")
+        return None, "Erreur : La clé API est manquante. Configurez AZURE_OPENAI_API_KEY."
+    except ValueError as e:
+        logger.error(f"Erreur d'initialisation du client : {str(e)}")
+        return None, f"Erreur : Initialisation du client impossible ({str(e)})."
+
+def _api_error_message(error: Exception) -> str:
+    """
+    Journalise une erreur levée par _complete et retourne le message d'erreur correspondant.
+    """
+    if isinstance(error, AuthenticationError):
+        logger.error("Erreur d'authentification : Vérifiez la clé API.")
+        return "Erreur : Clé API invalide ou problème d'authentification."
+    if isinstance(error, RateLimitError):
+        logger.error("Limite de taux dépassée après plusieurs tentatives.")
+        return "Erreur : Limite de taux dépassée. Réessayez plus tard."
+    if isinstance(error, APIConnectionError):
+        logger.error("Erreur de connexion à l'API.")
+        return "Erreur : Impossible de se connecter à l'API Azure OpenAI."
+    if isinstance(error, APIError):
+        logger.error(f"Erreur API : {str(error)}")
+        return f"Erreur : Problème avec l'API Azure OpenAI ({str(error)})."
+    logger.error(f"Erreur inattendue : {str(error)}")
+    return f"Erreur inattendue lors de l'appel à l'API : {str(error)}."
+
 def call_openai_api(
     prompt: str,
     max_tokens: int = 300,
@@ -34,56 +155,271 @@ def call_openai_api(
         logger.error("max_tokens doit être un entier positif inférieur à 4096.")
         return "Erreur : max_tokens doit être un entier positif inférieur à 4096."
 
-    
-    # Charger les variables d'environnement
-    api_key = api_key
-    azure_endpoint = api_endpoint
+    # Validation de la configuration et récupération du client partagé
+    client, error = _prepare_client(api_version)
+    if client is None:
+        return error
 
-    if not api_key:
-        logger.error("Clé API manquante dans les variables d'environnement.")
-        return "Erreur : La clé API est manquante. Configurez AZURE_OPENAI_API_KEY."
+    # Appel de l'API
+    try:
+        # Garde isEnabledFor : évite de découper le prompt si le niveau DEBUG est filtré
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Appel de l'API Azure OpenAI avec le prompt : %s", prompt[:50])
 
-    # Validation de l'endpoint
-    if not azure_endpoint.startswith("https://"):
-        logger.error("L'endpoint Azure doit commencer par 'https://'.")
-        return "Erreur : Endpoint Azure invalide."
+        result = _complete(client, prompt, max_tokens, model)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Réponse reçue : %s", result[:50])  # Log partiel de la réponse
+        return result
+
+    except Exception as e:
+        return _api_error_message(e)
+
+async def call_openai_api_many(
+    prompts: List[str],
+    concurrency: int = 10,
+    requests_per_minute: int = 60,
+    max_tokens: int = 300,
+    model: str = "gpt-4o-pionners10",
+    api_version: str = "2024-05-01-preview"
+) -> List[Union[str, BaseException]]:
+    """
+    Appelle Azure OpenAI en parallèle pour une liste de prompts.
+
+    Le nombre d'appels simultanés est borné par un sémaphore et le débit par un seau à jetons
+    (requests_per_minute), pour rester sous les limites de taux du déploiement. Les erreurs
+    transitoires sont réessayées avec un délai exponentiel aléatoire.
+
+    Args:
+        prompts (List[str]): Textes à envoyer à l'API.
+        concurrency (int): Nombre maximal d'appels simultanés (défaut: 10).
+        requests_per_minute (int): Nombre maximal d'appels par minute (défaut: 60).
+        max_tokens (int): Limite de tokens pour chaque réponse (défaut: 300).
+        model (str): Modèle Azure OpenAI à utiliser (défaut: gpt-4o-pionners10).
+        api_version (str): Version de l'API Azure OpenAI (défaut: 2024-05-01-preview).
+
+    Returns:
+        List[Union[str, BaseException]]: Réponses dans l'ordre des prompts, ou l'exception levée
+        pour les appels en échec.
+
+    Raises:
+        ValueError: Si prompts n'est pas une liste ou si concurrency est invalide.
+        KeyError: Si AZURE_OPENAI_API_KEY ou AZURE_OPENAI_ENDPOINT n'est pas défini.
+    """
+    if not isinstance(prompts, list):
+        raise ValueError("prompts doit être une liste de chaînes.")
+    if not isinstance(concurrency, int) or concurrency <= 0:
+        raise ValueError("concurrency doit être un entier positif.")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncLimiter(requests_per_minute, 60)
+
+    @_retry_transient
+    async def _one(client: AsyncAzureOpenAI, prompt: str) -> str:
+        async with semaphore, limiter:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+        return response.choices[0].message.content
+
+    # Client propre à cet appel : son pool httpx est lié à la boucle d'événements courante
+    # et ne peut pas être réutilisé par un asyncio.run ultérieur
+    async with AsyncAzureOpenAI(
+        api_key=os.environ["AZURE_OPENAI_API_KEY"],
+        api_version=api_version,
+        azure_endpoint=os.environ["AZURE_OPENAI_ENDPOINT"],
+        max_retries=0
+    ) as client:
+        logger.info("Appel de l'API Azure OpenAI pour %d prompts (concurrence : %d)", len(prompts), concurrency)
+        return await asyncio.gather(*[_one(client, prompt) for prompt in prompts], return_exceptions=True)
+
+def call_openai_batch(
+    prompts: List[str],
+    model: str,
+    poll_interval: int = 30,
+    max_tokens: int = 300,
+    api_version: str = BATCH_API_VERSION
+) -> List[Optional[str]]:
+    """
+    Soumet une liste de prompts à l'API Batch d'Azure OpenAI et attend les résultats.
+
+    Adapté aux traitements hors ligne volumineux : les requêtes sont traitées de façon
+    asynchrone par Azure (fenêtre de 24 h) à coût réduit, sans consommer le quota temps réel.
+
+    Args:
+        prompts (List[str]): Textes à envoyer à l'API.
+        model (str): Déploiement Azure OpenAI de type batch (« Global Batch ») à utiliser ; les
+            déploiements standard utilisés par call_openai_api ne sont pas acceptés.
+        poll_interval (int): Intervalle en secondes entre deux vérifications du statut (défaut: 30).
+        max_tokens (int): Limite de tokens pour chaque réponse (défaut: 300).
+        api_version (str): Version de l'API Azure OpenAI, compatible Batch (défaut: 2024-10-21).
+
+    Returns:
+        List[Optional[str]]: Réponses dans l'ordre des prompts (None pour les requêtes en échec).
+
+    Raises:
+        ValueError: Si prompts n'est pas une liste non vide ou si model est vide.
+        KeyError: Si AZURE_OPENAI_API_KEY ou AZURE_OPENAI_ENDPOINT n'est pas défini.
+        RuntimeError: Si le traitement batch échoue, expire ou est annulé.
+    """
+    if not prompts or not isinstance(prompts, list):
+        raise ValueError("prompts doit être une liste non vide de chaînes.")
+    if not model or not isinstance(model, str):
+        raise ValueError("model doit désigner un déploiement Azure OpenAI de type batch.")
+
+    client = _get_client(api_version)
+
+    # Fichier JSONL d'entrée : une requête par ligne, identifiée par son index
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as f:
+        for i, prompt in enumerate(prompts):
+            request = {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": "/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": max_tokens,
+                    "temperature": 0.7
+                }
+            }
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        input_path = f.name
 
-    # Initialisation du client Azure OpenAI
     try:
-        client = AzureOpenAI(
-            api_key=api_key,
-            api_version=api_version,
-            azure_endpoint=azure_endpoint
-        )
-    except ValueError as e:
-        logger.error(f"Erreur d'initialisation du client : {str(e)}")
-        return f"Erreur : Initialisation du client impossible ({str(e)})."
+        with open(input_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+    finally:
+        os.remove(input_path)
 
-    # Appel de l'API
+    batch = None
     try:
-        logger.info("Appel de l'API Azure OpenAI avec le prompt : %s", prompt[:50])
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=0.7
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/chat/completions",
+            completion_window="24h"
         )
-        result = response.choices[0].message.content
-        logger.info("Réponse reçue : %s", result[:50])  # Log partiel de la réponse
-        return result
+        logger.info("Batch %s soumis pour %d prompts", batch.id, len(prompts))
 
-    except AuthenticationError:
-        logger.error("Erreur d'authentification : Vérifiez la clé API.")
-        return "Erreur : Clé API invalide ou problème d'authentification."
-    except RateLimitError:
-        logger.error("Limite de taux dépassée.")
-        return "Erreur : Limite de taux dépassée. Réessayez plus tard."
-    except APIConnectionError:
-        logger.error("Erreur de connexion à l'API.")
-        return "Erreur : Impossible de se connecter à l'API Azure OpenAI."
-    except APIError as e:
-        logger.error(f"Erreur API : {str(e)}")
-        return f"Erreur : Problème avec l'API Azure OpenAI ({str(e)})."
-    except Exception as e:
-        logger.error(f"Erreur inattendue : {str(e)}")
-        return f"Erreur inattendue lors de l'appel à l'API : {str(e)}."
+        # Attente de la fin du traitement
+        while batch.status not in _BATCH_FINAL_STATUSES:
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+            logger.info("Batch %s : statut %s", batch.id, batch.status)
+
+        if batch.status != "completed":
+            logger.error("Le batch %s s'est terminé avec le statut %s", batch.id, batch.status)
+            raise RuntimeError(f"Échec du batch {batch.id} : statut {batch.status}")
+
+        # Lecture des résultats et remise dans l'ordre des prompts
+        results: List[Optional[str]] = [None] * len(prompts)
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[int(item["custom_id"])] = response["body"]["choices"][0]["message"]["content"]
+
+        failed = sum(result is None for result in results)
+        if failed:
+            logger.warning("%d requête(s) du batch %s sans réponse", failed, batch.id)
+        return results
+
+    finally:
+        # Suppression des fichiers d'entrée et de sortie stockés sur Azure
+        # (sauf si le batch est encore en cours, par exemple après une interruption)
+        if batch is not None and batch.status not in _BATCH_FINAL_STATUSES:
+            logger.warning("Batch %s toujours en cours : fichiers conservés sur Azure", batch.id)
+        else:
+            file_ids = [input_file.id]
+            if batch is not None:
+                file_ids += [batch.output_file_id, batch.error_file_id]
+            for file_id in filter(None, file_ids):
+                try:
+                    client.files.delete(file_id)
+                except APIError as e:
+                    logger.warning("Impossible de supprimer le fichier %s : %s", file_id, e)
+
+def call_openai_api_chunked(
+    prompts: List[str],
+    chunk_size: int = 20,
+    max_tokens: int = 300,
+    model: str = "gpt-4o-pionners10",
+    api_version: str = "2024-05-01-preview"
+) -> List[Optional[str]]:
+    """
+    Regroupe des prompts courts en listes numérotées envoyées en un seul appel à Azure OpenAI.
+
+    Chaque groupe de chunk_size prompts produit une seule requête, dont la réponse est
+    découpée selon les préfixes '[i]' (une réponse peut s'étendre sur plusieurs lignes).
+    Les prompts sans réponse dans le retour groupé sont renvoyés un par un via call_openai_api.
+    Si l'appel groupé échoue, le message d'erreur est renvoyé pour chaque prompt du groupe,
+    sans appels individuels. Les retours à la ligne des prompts sont remplacés par des espaces.
+
+    Args:
+        prompts (List[str]): Textes courts à envoyer à l'API (ex. titres d'articles).
+        chunk_size (int): Nombre de prompts par requête (défaut: 20).
+        max_tokens (int): Limite de tokens par réponse individuelle (défaut: 300).
+        model (str): Modèle Azure OpenAI à utiliser (défaut: gpt-4o-pionners10).
+        api_version (str): Version de l'API Azure OpenAI (défaut: 2024-05-01-preview).
+
+    Returns:
+        List[Optional[str]]: Réponses (ou messages d'erreur) dans l'ordre des prompts.
+
+    Raises:
+        ValueError: Si prompts n'est pas une liste de chaînes non vides ou si chunk_size est invalide.
+    """
+    if not isinstance(prompts, list) or not all(isinstance(p, str) and p.strip() for p in prompts):
+        raise ValueError("prompts doit être une liste de chaînes non vides.")
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise ValueError("chunk_size doit être un entier positif.")
+
+    # Les retours à la ligne d'un prompt casseraient la numérotation : ils sont aplatis
+    flattened = [" ".join(prompt.split()) for prompt in prompts]
+
+    # Erreur de configuration : reportée sur tous les prompts, sans aucun appel
+    client, error = _prepare_client(api_version)
+    if client is None:
+        return [error] * len(prompts)
+
+    results: List[Optional[str]] = []
+    for start in range(0, len(flattened), chunk_size):
+        chunk = flattened[start:start + chunk_size]
+        numbered = "\n".join(f"[{i}] {prompt}" for i, prompt in enumerate(chunk, start=1))
+        try:
+            output = _complete(
+                client,
+                f"{_CHUNK_INSTRUCTION}\n{numbered}",
+                min(max_tokens * len(chunk), 4096),
+                model
+            )
+        except Exception as e:
+            # Échec de l'appel groupé (limite de taux, authentification...) : l'erreur est reportée
+            # sur tout le groupe, sans multiplier les appels individuels voués au même échec
+            message = _api_error_message(e)
+            results.extend([message] * len(chunk))
+            continue
+
+        # Le contenu peut être None (ex. réponse bloquée par le filtre de contenu)
+        answers: Dict[int, str] = {}
+        if output is not None:
+            for i, answer in _CHUNK_ANSWER_PATTERN.findall(output):
+                if answer:
+                    answers.setdefault(int(i), answer)
+
+        # Réponse incomplète : seuls les prompts sans réponse sont renvoyés un par un
+        missing = [i for i in range(1, len(chunk) + 1) if i not in answers]
+        if missing:
+            logger.warning(
+                "Réponse groupée incomplète (%d/%d éléments), appels individuels pour les manquants",
+                len(chunk) - len(missing), len(chunk),
+            )
+            for i in missing:
+                answers[i] = call_openai_api(chunk[i - 1], max_tokens=max_tokens, model=model, api_version=api_version)
+
+        results.extend(answers[i] for i in range(1, len(chunk) + 1))
+    return results
@@ -1,23 +1,239 @@
 import os
+import re
+import time
+import uuid
+import shutil
+import hashlib
 import logging
+import tempfile
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional
+from typing import Iterable, Iterator, List, Literal, Optional, Union
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
+from google.cloud import storage
 from google.api_core import exceptions
-from functions.initialize_client import initialize_bigquery_client
+from functions.initialize_client import initialize_bigquery_client, get_bqstorage_client, get_client_credentials
+from functions import _logging  # noqa: F401  (configuration commune du logging)
 
-# Configuration du logging pour tracer les événements et erreurs
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
 logger = logging.getLogger(__name__)
 
 # Limite maximale de taille des données à exporter (en Go)
 MAX_DATA_SIZE_GB = 2  # Taille maximale des données en mémoire (modifiable)
 MAX_DATA_SIZE_BYTES = MAX_DATA_SIZE_GB * 1024**3  # Conversion en octets
 
+# Seuil (octets traités) au-delà duquel les résultats transitent par un export GCS
+LARGE_RESULT_THRESHOLD_BYTES = 500 * 1024**2
+# Nombre de fragments téléchargés en parallèle depuis GCS
+GCS_DOWNLOAD_WORKERS = 8
+
+# Taille des blocs lus par le lecteur CSV Arrow (8 Mo)
+CSV_READ_BLOCK_SIZE = 8 << 20
+# Formats d'horodatage reconnus à la relecture des CSV extraits
+CSV_TIMESTAMP_PARSERS = [pa_csv.ISO8601, "%Y-%m-%d %H:%M:%S"]
+
+# Cache local des résultats : sous-dossier de output_dir et durée de validité par défaut
+CACHE_DIR_NAME = ".cache"
+CACHE_TTL_SECONDS = 3600
+
+def _cache_key(
+    query: str,
+    maximum_bytes_billed: Optional[int],
+    ) -> str:
+    """
+    Calcule la clé de cache d'une requête (BLAKE2 de la requête normalisée).
+    """
+    normalized = re.sub(r"\s+", " ", query.strip())
+    return hashlib.blake2b(f"{normalized}|{maximum_bytes_billed}".encode(), digest_size=16).hexdigest()
+
+def _is_cache_fresh(
+    client: bigquery.Client,
+    cache_path: str,
+    source_tables: List[Union[str, bigquery.TableReference]],
+    ttl_seconds: int,
+    ) -> bool:
+    """
+    Indique si un résultat en cache est plus récent que les tables sources.
+
+    Si aucune table source n'est connue ou si leurs métadonnées sont inaccessibles,
+    le résultat est considéré valide pendant ttl_seconds. Une vue, dont la date de
+    modification est celle de sa définition et non de ses données, invalide le cache.
+
+    Args:
+        client (bigquery.Client): Client BigQuery pour lire les métadonnées des tables.
+        cache_path (str): Chemin du fichier en cache.
+        source_tables (List[Union[str, bigquery.TableReference]]): Tables lues par la requête.
+        ttl_seconds (int): Durée de validité à défaut de tables sources.
+
+    Returns:
+        bool: True si le fichier en cache peut être réutilisé.
+    """
+    if not os.path.exists(cache_path):
+        return False
+    cached_at = os.path.getmtime(cache_path)
+    if source_tables:
+        try:
+            for table_ref in source_tables:
+                table = client.get_table(table_ref)
+                if table.table_type == "VIEW" or table.modified is None:
+                    return False
+                if table.modified.timestamp() > cached_at:
+                    return False
+            return True
+        except exceptions.GoogleAPIError as e:
+            logger.warning("Métadonnées des tables sources indisponibles, validité par durée : %s", e)
+    return time.time() - cached_at <= ttl_seconds
+
+def _link_or_copy(
+    source: str,
+    destination: str,
+    ) -> None:
+    """
+    Crée un lien physique vers source, ou une copie si le système de fichiers ne le permet pas.
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def _export_via_gcs(
+    client: bigquery.Client,
+    query_job: bigquery.QueryJob,
+    bucket_name: str,
+    table_name: str,
+    ) -> Iterator[pa.RecordBatch]:
+    """
+    Exporte le résultat d'une requête vers GCS (Parquet/Snappy) et en relit les lots Arrow.
+
+    BigQuery écrit lui-même les fragments en parallèle côté serveur ; ils sont ensuite
+    téléchargés en parallèle dans un dossier temporaire. Les fragments sont supprimés
+    de GCS et du disque une fois la lecture terminée.
+
+    Args:
+        client (bigquery.Client): Client BigQuery ayant exécuté la requête.
+        query_job (bigquery.QueryJob): Requête terminée dont la table de destination est exportée.
+        bucket_name (str): Nom du bucket GCS de transit.
+        table_name (str): Nom logique du jeu de résultats (préfixe des fragments).
+
+    Yields:
+        pa.RecordBatch: Lots Arrow lus depuis les fragments Parquet.
+    """
+    prefix = f"{table_name}_{uuid.uuid4().hex[:8]}_"
+    destination_uri = f"gs://{bucket_name}/{prefix}*.parquet"
+    extract_config = bigquery.ExtractJobConfig(
+        destination_format=bigquery.DestinationFormat.PARQUET,
+        compression=bigquery.Compression.SNAPPY,
+    )
+    logger.info("Export de la table de résultats vers %s", destination_uri)
+    client.extract_table(
+        query_job.destination,
+        destination_uri,
+        job_config=extract_config,
+        location=query_job.location,
+    ).result()
+
+    storage_client = storage.Client(project=client.project, credentials=get_client_credentials(client))
+    blobs = sorted(storage_client.list_blobs(bucket_name, prefix=prefix), key=lambda blob: blob.name)
+    logger.info("%d fragment(s) à télécharger depuis GCS", len(blobs))
+
+    try:
+        with tempfile.TemporaryDirectory() as staging_dir:
+            paths = [os.path.join(staging_dir, os.path.basename(blob.name)) for blob in blobs]
+            with ThreadPoolExecutor(max_workers=GCS_DOWNLOAD_WORKERS) as executor:
+                list(executor.map(lambda args: args[0].download_to_filename(args[1]), zip(blobs, paths)))
+            for path in paths:
+                yield from pq.ParquetFile(path).iter_batches()
+    finally:
+        for blob in blobs:
+            try:
+                blob.delete()
+            except exceptions.GoogleAPIError as e:
+                logger.warning("Impossible de supprimer le fragment %s : %s", blob.name, e)
+
+def _open_writer(
+    output_file: str,
+    schema: pa.Schema,
+    output_format: str,
+    ):
+    """
+    Ouvre un writer Arrow en flux pour le format de sortie demandé (CSV ou Parquet/Snappy).
+
+    Raises:
+        PermissionError: Si le dossier de sortie n’est pas accessible en écriture.
+    """
+    try:
+        if output_format == "parquet":
+            return pq.ParquetWriter(output_file, schema, compression="snappy")
+        return pa_csv.CSVWriter(output_file, schema, write_options=pa_csv.WriteOptions(include_header=True))
+    except PermissionError as e:
+        raise PermissionError(f"Pas de droits d’écriture dans le dossier : {os.path.dirname(output_file)}") from e
+
+def _write_batches(
+    batches: Iterable[pa.RecordBatch],
+    output_file: str,
+    output_format: str,
+    limit_bytes: bool,
+    ) -> Optional[int]:
+    """
+    Écrit des lots Arrow dans un fichier CSV ou Parquet, lot par lot.
+
+    Seul le lot en cours est gardé en mémoire. Si limit_bytes est activé et que le volume
+    cumulé des lots dépasse MAX_DATA_SIZE_BYTES, l'écriture est interrompue et le fichier
+    partiel est supprimé.
+
+    Args:
+        batches (Iterable[pa.RecordBatch]): Lots Arrow à écrire.
+        output_file (str): Chemin du fichier à écrire.
+        output_format (str): Format du fichier ("csv" ou "parquet").
+        limit_bytes (bool): Si True, limite la taille des données extraites à MAX_DATA_SIZE_GB.
+
+    Returns:
+        Optional[int]: Nombre de lignes écrites, ou None si la limite de taille est dépassée.
+        Si aucun lot n'est reçu, aucun fichier n'est créé et 0 est renvoyé.
+    """
+    written = 0
+    num_rows = 0
+    exceeded = False
+    writer = None
+    try:
+        for batch in batches:
+            written += batch.nbytes
+            if limit_bytes and written > MAX_DATA_SIZE_BYTES:
+                exceeded = True
+                break
+            if writer is None:
+                writer = _open_writer(output_file, batch.schema, output_format)
+            writer.write_batch(batch)
+            num_rows += batch.num_rows
+    except Exception:
+        # Suppression du fichier partiel en cas d'erreur pendant l'écriture
+        if writer is not None:
+            writer.close()
+            writer = None
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if exceeded:
+        logger.warning(
+            f"La taille des données (plus de {written / 1024**3:.2f} Go) dépasse la limite fixée de {MAX_DATA_SIZE_GB} Go. "
+            "Exportation annulée !"
+        )
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return None
+    return num_rows
+
 def extract_table(
     query: str,
     table_name: str,
@@ -30,28 +246,50 @@ def extract_table(
     export_empty: bool = False,
     maximum_bytes_billed: Optional[int] = None,
     limit_bytes: bool = True,
+    bqstorage_client: Optional[bigquery_storage.BigQueryReadClient] = None,
+    gcs_staging_bucket: Optional[str] = None,
+    large_result_threshold_bytes: int = LARGE_RESULT_THRESHOLD_BYTES,
+    output_format: Literal["csv", "parquet"] = "csv",
+    dry_run_budget_bytes: Optional[int] = None,
+    use_cache: bool = False,
+    source_tables: Optional[List[str]] = None,
+    cache_ttl_seconds: int = CACHE_TTL_SECONDS,
 ) -> Optional[str]:
     """
-    Exécute une requête BigQuery, récupère les résultats et les exporte en CSV localement.
+    Exécute une requête BigQuery, récupère les résultats et les exporte localement (CSV ou Parquet).
 
     Args:
         query (str): Requête SQL à exécuter.
         table_name (str): Nom logique de la table ou du jeu de résultats.
-        output_dir (str): Répertoire où enregistrer le fichier CSV.
+        output_dir (str): Répertoire où enregistrer le fichier.
         client (bigquery.Client, optional): Client BigQuery existant.
         project_id (str, optional): ID du projet GCP (si client non fourni).
         credentials_path (str, optional): Chemin vers un fichier JSON de credentials.
         env_var (str, optional): Nom de la variable d’environnement avec les credentials.
-        suffix_timestamp (bool): Ajoute un timestamp au nom du fichier CSV.
-        export_empty (bool): Si True, exporte un CSV vide même si aucun résultat.
+        suffix_timestamp (bool): Ajoute un timestamp au nom du fichier.
+        export_empty (bool): Si True, exporte un fichier vide même si aucun résultat.
         maximum_bytes_billed (int, optional): Limite de données scannées (facturation).
         limit_bytes (bool): Si True, limite la taille des données extraites à MAX_DATA_SIZE_GB.
+        bqstorage_client (bigquery_storage.BigQueryReadClient, optional): Client BigQuery Storage
+            existant (par défaut, un client partagé utilisant les identifiants de client).
+        gcs_staging_bucket (str, optional): Bucket GCS de transit. Si fourni, les résultats
+            volumineux sont exportés par BigQuery vers GCS puis téléchargés en parallèle.
+        large_result_threshold_bytes (int): Octets traités au-delà desquels l'export GCS est utilisé.
+        output_format (str): "csv" (défaut) ou "parquet" (compression Snappy).
+        dry_run_budget_bytes (int, optional): Si fourni, un dry-run estime les octets traités (scannés,
+            et non la taille du résultat) et la requête est annulée avant exécution au-delà de ce budget.
+        use_cache (bool): Si True, réutilise le résultat en cache dans output_dir/.cache tant que
+            les tables sources n'ont pas été modifiées depuis (défaut: False ; peu utile pour des
+            tables mises à jour en continu comme celles de GDELT).
+        source_tables (List[str], optional): Tables lues par la requête (`projet.dataset.table`).
+            Par défaut, les tables référencées par un dry-run de la requête.
+        cache_ttl_seconds (int): Durée de validité du cache lorsque les tables sources sont inconnues.
 
     Returns:
-        Optional[str]: Chemin du fichier CSV généré ou None si vide, trop lourd ou erreur.
+        Optional[str]: Chemin du fichier généré ou None si vide, trop lourd ou erreur.
 
     Raises:
-        ValueError: Si les arguments query, table_name, output_dir ou project_id sont invalides.
+        ValueError: Si les arguments query, table_name, output_dir, output_format ou project_id sont invalides.
         PermissionError: Si le dossier de sortie n’est pas accessible en écriture.
         RuntimeError: En cas d’erreur d’initialisation du client ou d’erreur API BigQuery.
     """
@@ -62,12 +300,12 @@ def extract_table(
         raise ValueError("Le nom de la table doit être une chaîne non vide")
     if not output_dir or not isinstance(output_dir, str):
         raise ValueError("Le dossier de sortie doit être une chaîne non vide")
+    if output_format not in ("csv", "parquet"):
+        raise ValueError("Le format de sortie doit être 'csv' ou 'parquet'")
 
-    # Création du dossier de sortie s’il n’existe pas
+    # Création du dossier de sortie s’il n’existe pas (les droits d’écriture sont
+    # vérifiés à l’ouverture du fichier de sortie)
     os.makedirs(output_dir, exist_ok=True)
-    # Vérification des permissions d’écriture sur le dossier
-    if not os.access(output_dir, os.W_OK):
-        raise PermissionError(f"Pas de droits d’écriture dans le dossier : {output_dir}")
 
     # Initialisation du client BigQuery si non fourni
     if client is None:
@@ -88,57 +326,120 @@ def extract_table(
     # Log du début de l’extraction
     logger.info("Début de l'extraction pour la table '%s'", table_name)
 
-    # Construction du nom du fichier CSV avec un timestamp optionnel
+    # Construction du nom du fichier avec un timestamp optionnel
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") if suffix_timestamp else ""
-    output_file = os.path.join(output_dir, f"{table_name}{'_' + timestamp if timestamp else ''}.csv")
+    output_file = os.path.join(output_dir, f"{table_name}{'_' + timestamp if timestamp else ''}.{output_format}")
+
+    # Fichier de cache associé à la requête
+    cache_path = os.path.join(
+        output_dir, CACHE_DIR_NAME, f"{_cache_key(query, maximum_bytes_billed)}.{output_format}"
+    )
 
     try:
+        # Dry-run gratuit, partagé entre le cache (tables référencées) et le budget (octets estimés)
+        dry_run_job = None
+        if (use_cache and source_tables is None) or dry_run_budget_bytes is not None:
+            dry_run_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+            dry_run_job = client.query(query, job_config=dry_run_config)
+
+        # Réutilisation du résultat en cache si les tables sources n'ont pas changé depuis
+        if use_cache:
+            if source_tables is None:
+                source_tables = list(dry_run_job.referenced_tables)
+            if _is_cache_fresh(client, cache_path, source_tables, cache_ttl_seconds):
+                _link_or_copy(cache_path, output_file)
+                logger.info("Résultat en cache réutilisé pour %s : %s", table_name, os.path.basename(output_file))
+                return output_file
+
+        # Client BigQuery Storage pour télécharger les résultats en Arrow plutôt qu'en JSON paginé
+        if bqstorage_client is None:
+            bqstorage_client = get_bqstorage_client(client)
+
         # Configuration de la requête avec une limite de facturation optionnelle
         job_config = bigquery.QueryJobConfig()
         if maximum_bytes_billed is not None:
             job_config.maximum_bytes_billed = maximum_bytes_billed
             logger.info("Limite de facturation définie à %d octets", maximum_bytes_billed)
 
+        # Contrôle du volume estimé par le dry-run, avant de lancer la vraie requête
+        if dry_run_budget_bytes is not None:
+            estimated_bytes = dry_run_job.total_bytes_processed or 0
+            if estimated_bytes > dry_run_budget_bytes:
+                logger.warning(
+                    f"Le volume estimé ({estimated_bytes / 1024**3:.2f} Go) dépasse le budget de {dry_run_budget_bytes / 1024**3:.2f} Go. "
+                    "Requête annulée avant exécution !"
+                )
+                return None
+            logger.info("Octets estimés par dry-run : %d", estimated_bytes)
+
         # Exécution de la requête BigQuery
         query_job = client.query(query, job_config=job_config)
-        # Conversion des résultats en DataFrame pandas (sans barre de progression)
-        df = query_job.to_dataframe(progress_bar_type=None)
+        rows = query_job.result()
 
         # Log des octets facturés pour suivi
         bytes_billed = query_job.total_bytes_billed or 0
         logger.info("Octets facturés : %d", bytes_billed)
 
-        # Vérification de la taille mémoire du DataFrame si limit_bytes est activé
-        if limit_bytes:
-            data_size = df.memory_usage(deep=True).sum()
-            if data_size > MAX_DATA_SIZE_BYTES:
-                logger.warning(
-                    f"La taille des données ({data_size / 1024**3:.2f} Go) dépasse la limite fixée de {MAX_DATA_SIZE_GB} Go. "
-                    "Exportation annulée !"
-                )
-                return None
+        # Un fichier existant peut être un lien physique vers le cache (même avec use_cache=False) :
+        # on le détache avant réécriture pour ne pas écraser l'entrée de cache
+        if os.path.exists(output_file):
+            os.remove(output_file)
 
         # Gestion des résultats vides
-        if df.empty:
+        if rows.total_rows == 0:
             logger.warning("La requête pour %s a retourné un résultat vide.", table_name)
             if not export_empty:
-                logger.info("Aucun fichier CSV généré (export_empty=False).")
+                logger.info("Aucun fichier généré (export_empty=False).")
                 return None
-            logger.info("Un fichier CSV vide sera généré.")
+            logger.info("Un fichier vide sera généré.")
+            # Une table Arrow vide porte le schéma (en-tête du CSV, métadonnées Parquet)
+            empty_table = rows.to_arrow(create_bqstorage_client=False)
+            with _open_writer(output_file, empty_table.schema, output_format) as writer:
+                writer.write_table(empty_table)
+            logger.info("Les données ont été exportées dans le fichier : %s", os.path.basename(output_file))
+            return output_file
 
-        # Sauvegarde du DataFrame dans un fichier CSV (UTF-8, sans compression)
-        df.to_csv(output_file, index=False, encoding="utf-8", compression=None)
+        # Résultats volumineux : export côté serveur vers GCS plutôt que lecture en flux
+        bytes_processed = query_job.total_bytes_processed or 0
+        if gcs_staging_bucket and bytes_processed > large_result_threshold_bytes:
+            logger.info(
+                "Octets traités (%d) au-delà du seuil de %d octets : export via gs://%s",
+                bytes_processed, large_result_threshold_bytes, gcs_staging_bucket,
+            )
+            batches = _export_via_gcs(client, query_job, gcs_staging_bucket, table_name)
+        else:
+            batches = rows.to_arrow_iterable(bqstorage_client=bqstorage_client)
+
+        # Écriture en flux des lots Arrow, sans DataFrame intermédiaire
+        with closing(batches):
+            num_rows = _write_batches(batches, output_file, output_format, limit_bytes)
+        if num_rows is None:
+            return None
+        # Aucun lot reçu (total_rows inconnu, ex. script ou DDL) : aucun fichier n'a été ouvert
+        if not os.path.exists(output_file):
+            logger.warning("La requête pour %s n'a retourné aucun lot de données.", table_name)
+            logger.info("Aucun fichier généré.")
+            return None
         logger.info("Les données ont été exportées dans le fichier : %s", os.path.basename(output_file))
-        logger.info("Nombre de lignes dans le fichier : %d", len(df))
+        logger.info("Nombre de lignes dans le fichier : %d", num_rows)
+
+        # Mise en cache du fichier pour les exécutions suivantes de la même requête
+        if use_cache:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            _link_or_copy(output_file, cache_path)
 
-        # Retour du chemin du fichier CSV généré
+        # Retour du chemin du fichier généré
         return output_file
 
     except exceptions.Forbidden as e:
         # Gestion de l’erreur si maximum_bytes_billed est dépassé
         logger.error("Limite de facturation dépassée pour %s : %s", table_name, e)
-        logger.info("Aucun fichier CSV généré en raison de la limite maximum_bytes_billed.")
+        logger.info("Aucun fichier généré en raison de la limite maximum_bytes_billed.")
         return None
+    except PermissionError:
+        # Dossier de sortie non accessible en écriture
+        logger.error("Pas de droits d’écriture dans le dossier : %s", output_dir)
+        raise
     except exceptions.GoogleAPIError as e:
         # Gestion des erreurs API BigQuery génériques
         logger.error("Erreur API BigQuery pour %s : %s", table_name, e)
@@ -146,4 +447,34 @@ def extract_table(
     except Exception as e:
         # Gestion des erreurs inattendues
         logger.error("Erreur inattendue lors de l'extraction de %s : %s", table_name, e)
-        raise RuntimeError(f"Échec de l'extraction pour {table_name} : {e}") from e
\ No newline at end of file
+        raise RuntimeError(f"Échec de l'extraction pour {table_name} : {e}") from e
+
+def load_extracted_csv(path: str) -> pd.DataFrame:
+    """
+    Charge un CSV produit par extract_table dans un DataFrame pandas via le lecteur CSV Arrow.
+
+    La lecture est multithreadée et les tampons Arrow sont libérés au fil de la conversion
+    vers pandas, ce qui limite le pic de mémoire par rapport à pd.read_csv.
+
+    Args:
+        path (str): Chemin du fichier CSV à charger.
+
+    Returns:
+        pd.DataFrame: Contenu du fichier CSV.
+
+    Raises:
+        ValueError: Si le chemin est vide ou invalide.
+        FileNotFoundError: Si le fichier n'existe pas.
+    """
+    if not path or not isinstance(path, str):
+        raise ValueError("Le chemin du fichier doit être une chaîne non vide")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Fichier introuvable : {path}")
+
+    table = pa_csv.read_csv(
+        path,
+        read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_READ_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(timestamp_parsers=CSV_TIMESTAMP_PARSERS),
+    )
+    logger.info("Fichier %s chargé : %d lignes", os.path.basename(path), table.num_rows)
+    return table.to_pandas(self_destruct=True, split_blocks=True)
@@ -1,5 +1,4 @@
 import os
-import glob
 from typing import Optional
 
 def get_latest_file_by_keyword(
@@ -36,15 +35,24 @@ def get_latest_file_by_keyword(
     if not os.access(directory, os.R_OK):
         raise PermissionError(f"Dossier non lisible : {directory}")
 
-    # Recherche du fichier dans le dossier indiqué
-    pattern = os.path.join(directory, f"*{keyword}*{extension}")
-    matching_files = glob.glob(pattern)
-
-    if not matching_files:
+    # Parcours unique du dossier : un seul stat par fichier correspondant
+    latest_file = None
+    latest_mtime = -1.0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = entry.name
+            # Les fichiers cachés sont ignorés, comme avec un motif glob
+            if name.startswith(".") or keyword not in name or not name.endswith(extension):
+                continue
+            if not entry.is_file():
+                continue
+            mtime = entry.stat(follow_symlinks=False).st_mtime
+            if mtime > latest_mtime:
+                latest_mtime, latest_file = mtime, entry.path
+
+    if latest_file is None:
         print(f" Aucun fichier trouvé contenant '{keyword}' avec l'extension '{extension}' dans {directory}")
-        return None  
-    
-    # Recuperation du fichier le plus récent
-    latest_file = max(matching_files, key=os.path.getmtime)
+        return None
+
     print(f" Fichier le plus récent trouvé dans {directory} pour '{keyword}' : {os.path.basename(latest_file)}")
-    return os.path.basename(latest_file)
+    return latest_file
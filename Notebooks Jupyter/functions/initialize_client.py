@@ -1,18 +1,25 @@
 import os
 import logging
-from typing import Optional
+import weakref
+from typing import Dict, Optional, Tuple
+from google.auth.credentials import Credentials
 from google.cloud import bigquery
+from google.cloud import bigquery_storage
 from google.api_core import exceptions
 from google.oauth2 import service_account
 from functions.setup_authentication import setup_authentication
+from functions import _logging  # noqa: F401  (configuration commune du logging)
 
-# Configuration du logging pour suivre les événements et erreurs
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    )
 logger = logging.getLogger(__name__)
 
+# Clients BigQuery partagés par (project_id, credentials_path, env_var) : évite de relire
+# le fichier de clé et de rouvrir les connexions HTTPS à chaque appel
+_CLIENTS: Dict[Tuple[str, Optional[str], Optional[str]], bigquery.Client] = {}
+
+# Clients BigQuery Storage rattachés au client BigQuery dont ils reprennent les identifiants.
+# Une entrée disparaît avec son client BigQuery, ou explicitement via close_bigquery_client.
+_BQ_STORAGE_CLIENTS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
 def initialize_bigquery_client(
     project_id: str,
     credentials_path: Optional[str] = None,
@@ -26,7 +33,9 @@ def initialize_bigquery_client(
         project_id (str): L'identifiant du projet Google Cloud.
         credentials_path (Optional[str]): Chemin vers le fichier JSON du compte de service.
         env_var (Optional[str]): Nom de la variable d'environnement à définir pour l'authentification.
-        auto_close (bool): Si True, ferme le client en cas d'erreur. Si False, l'appelant doit le fermer.
+        auto_close (bool): Si True, ferme le client en cas d'erreur. Si False, le client est mis en cache
+            et réutilisé pour les mêmes paramètres : le fermer avec close_bigquery_client, et non
+            client.close(), pour qu'il soit retiré du cache.
 
     Returns:
         bigquery.Client: Une instance du client BigQuery.
@@ -42,6 +51,79 @@ def initialize_bigquery_client(
         logger.error("L'identifiant du projet doit être une chaîne non vide")
         raise ValueError("L'identifiant du projet doit être une chaîne non vide")
 
+    # Sans fermeture automatique, le client est partagé entre les appels de mêmes paramètres
+    if not auto_close:
+        key = (project_id, credentials_path, env_var)
+        if key not in _CLIENTS:
+            _CLIENTS[key] = _build_client(project_id, credentials_path, env_var, auto_close=False)
+        return _CLIENTS[key]
+    return _build_client(project_id, credentials_path, env_var, auto_close)
+
+def close_bigquery_client(client: bigquery.Client) -> None:
+    """
+    Ferme un client BigQuery (et son client BigQuery Storage) et le retire du cache de
+    initialize_bigquery_client.
+
+    Un appel ultérieur à initialize_bigquery_client avec les mêmes paramètres crée alors
+    un nouveau client au lieu de renvoyer l'instance fermée. Les autres clients en cache
+    ne sont pas affectés.
+
+    Args:
+        client (bigquery.Client): Client BigQuery à fermer.
+    """
+    try:
+        client.close()
+        logger.info("Client BigQuery fermé")
+    finally:
+        for key in [key for key, cached in _CLIENTS.items() if cached is client]:
+            del _CLIENTS[key]
+        storage_client = _BQ_STORAGE_CLIENTS.pop(client, None)
+        if storage_client is not None:
+            storage_client.transport.close()
+            logger.debug("Client BigQuery Storage associé fermé")
+
+def get_client_credentials(client: bigquery.Client) -> Credentials:
+    """
+    Retourne les identifiants utilisés par un client BigQuery.
+
+    Args:
+        client (bigquery.Client): Client BigQuery.
+
+    Returns:
+        Credentials: Identifiants du client (fichier de compte de service ou ADC).
+    """
+    # La bibliothèque BigQuery n'expose pas d'accesseur public pour les identifiants
+    return client._credentials
+
+def get_bqstorage_client(client: bigquery.Client) -> bigquery_storage.BigQueryReadClient:
+    """
+    Retourne le client BigQuery Storage associé à un client BigQuery, en le créant au premier appel.
+
+    Comme pour to_dataframe, le client Storage reprend les identifiants du client BigQuery.
+    Sa durée de vie suit celle du client BigQuery : il est fermé par close_bigquery_client.
+
+    Args:
+        client (bigquery.Client): Client BigQuery dont les identifiants sont repris.
+
+    Returns:
+        bigquery_storage.BigQueryReadClient: Client de lecture BigQuery Storage.
+    """
+    storage_client = _BQ_STORAGE_CLIENTS.get(client)
+    if storage_client is None:
+        storage_client = bigquery_storage.BigQueryReadClient(credentials=get_client_credentials(client))
+        _BQ_STORAGE_CLIENTS[client] = storage_client
+        logger.info("Client BigQuery Storage initialisé")
+    return storage_client
+
+def _build_client(
+    project_id: str,
+    credentials_path: Optional[str],
+    env_var: Optional[str],
+    auto_close: bool,
+    ) -> bigquery.Client:
+    """
+    Construit un nouveau client BigQuery (voir initialize_bigquery_client).
+    """
     client = None
     try:
         client_params = {"project": project_id, "location": "US"}
@@ -62,6 +144,9 @@ def initialize_bigquery_client(
         logger.info("Client BigQuery initialisé pour le projet %s", project_id)
         return client
 
+    except (ValueError, FileNotFoundError, PermissionError):
+        # Erreurs de validation documentées (via setup_authentication) : propagées telles quelles
+        raise
     except exceptions.NotFound as e:
         logger.error("Projet %s introuvable ou accès refusé : %s", project_id, e)
         raise RuntimeError(f"Projet {project_id} introuvable ou accès refusé") from e
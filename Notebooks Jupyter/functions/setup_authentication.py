@@ -1,12 +1,8 @@
 import os
 import logging
 from typing import Optional
+from functions import _logging  # noqa: F401  (configuration commune du logging)
 
-# Configuration du logging pour suivre les événements et erreurs
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    )
 logger = logging.getLogger(__name__)
 
 def setup_authentication(
@@ -36,16 +32,26 @@ def setup_authentication(
         raise ValueError("Le chemin du fichier de clé doit être une chaîne non vide")
 
     # Normalisation du chemin pour compatibilité multi-plateforme
+    # (chemin absolu requis par GOOGLE_APPLICATION_CREDENTIALS)
     key_path = os.path.abspath(key_path)
 
-    # Vérification de l'existence du fichier
-    if not os.path.exists(key_path):
+    # Vérification de l'existence du fichier (un seul appel système) ; comme os.path.exists,
+    # toute erreur d'accès (droits, composant qui n'est pas un dossier) vaut fichier introuvable
+    try:
+        key_stat = os.stat(key_path)
+    except OSError as e:
         logger.error("Fichier de clé introuvable : %s", key_path)
-        raise FileNotFoundError(f"Fichier de clé introuvable : {key_path}")
+        raise FileNotFoundError(f"Fichier de clé introuvable : {key_path}") from e
+
+    logger.debug("Fichier de clé %s : %d octets", key_path, key_stat.st_size)
 
     # Configuration de la variable d'environnement si spécifiée
     if env_var:
-        os.environ[env_var] = key_path
-        logger.info("Clé d'authentification chargée dans %s : %s", env_var, key_path)
+        # Écriture uniquement si la valeur change, pour ne pas invalider les identifiants en cache
+        if os.environ.get(env_var) != key_path:
+            os.environ[env_var] = key_path
+            logger.info("Clé d'authentification chargée dans %s : %s", env_var, key_path)
+        else:
+            logger.debug("%s pointe déjà vers %s", env_var, key_path)
     else:
         logger.info("Clé d'authentification validée : %s (aucune variable d'environnement définie)", key_path)